@@ -2,6 +2,7 @@
 API for easily writing an ODC Dataset
 """
 
+import functools
 import shutil
 import tempfile
 import uuid
@@ -1106,6 +1107,7 @@ class DatasetAssembler(DatasetPrepare):
         naming_conventions: str = "default",
         names: NamingConventions | None = None,
         dataset: DatasetDoc | None = None,
+        compress: str = "deflate",
     ) -> None:
         """
         Assemble a dataset with ODC metadata, writing metadata and (optionally) its imagery as COGs.
@@ -1149,8 +1151,17 @@ class DatasetAssembler(DatasetPrepare):
         :param naming_conventions:
             Naming conventions to use. Supports `default` or `dea`. The latter has stricter metadata requirements
             (try it and see -- it will tell your what's missing).
+        :param compress:
+            GDAL compression method for written measurements: 'deflate' (default) or
+            'zstd'. Zstd is typically both faster to write and faster to read.
         """
+        if compress.lower() not in images.COMPRESSION_LEVEL_OPTIONS:
+            raise ValueError(
+                f"Unsupported compression {compress!r}. "
+                f"Expected one of: {', '.join(images.COMPRESSION_LEVEL_OPTIONS)}"
+            )
         self._exists_behaviour = if_exists
+        self._compress = compress
         self._checksum = PackageChecksum()
         self._tmp_work_path: Path | None = None
 
@@ -1403,13 +1414,23 @@ class DatasetAssembler(DatasetPrepare):
     ):
         _validate_property_name(name)
 
-        res = FileWrite.from_existing(grid.shape).write_from_ndarray(
+        # The valid data is taken from each strip of rows as it's written, so that
+        # hdf5 datasets are only read (and decompressed) once.
+        rows_written = None
+        if expand_valid_data:
+            rows_written = functools.partial(
+                self._measurements.expand_valid_data_rows, grid, nodata=nodata
+            )
+        res = FileWrite.from_existing(
+            grid.shape, compress=self._compress
+        ).write_from_ndarray(
             data,
             out_path,
             geobox=grid,
             nodata=nodata,
             overview_resampling=overview_resampling,
             overviews=overviews,
+            rows_written=rows_written,
         )
 
         # Ensure the file_format field is set to what we're writing.
@@ -1429,7 +1450,8 @@ class DatasetAssembler(DatasetPrepare):
             out_path,
             data,
             nodata=nodata,
-            expand_valid_data=expand_valid_data,
+            # (already done as it was written)
+            expand_valid_data=False,
         )
         # We checksum immediately as the file has *just* been written so it may still
         # be in os/filesystem cache.
@@ -10,8 +10,6 @@ from collections.abc import Generator
 from pathlib import Path, PurePath
 from urllib.parse import urlparse
 
-from boltons import iterutils
-
 from eodatasets3 import serialise
 
 _DOCUMENT_EXTENSIONS = (".yaml", ".yml", ".json")
@@ -204,7 +202,7 @@ def docpath_set(doc, path, value):
 
 
 def make_paths_relative(
-    doc: dict, base_directory: PurePath, allow_paths_outside_base=False
+    doc: dict | list, base_directory: PurePath, allow_paths_outside_base=False
 ):
     """
     Find all pathlib.Path values in a document structure and make them relative to the given path.
@@ -226,14 +224,18 @@ def make_paths_relative(
     >>> doc
     {'villains': 'the-baron.txt'}
     """
-    for doc_path, value in iterutils.research(
-        doc, lambda p, k, v: isinstance(v, PurePath)
-    ):
-        value: PurePath
-        value = relative_path(
-            value, base_directory, allow_paths_outside_base=allow_paths_outside_base
-        )
-        docpath_set(doc, doc_path, value.as_posix())
+    # Replace in a single pass, rather than searching the document and then
+    # walking back down to set each path found.
+    items = doc.items() if isinstance(doc, dict) else enumerate(doc)
+    for key, value in items:
+        if isinstance(value, PurePath):
+            doc[key] = relative_path(
+                value, base_directory, allow_paths_outside_base=allow_paths_outside_base
+            ).as_posix()
+        elif isinstance(value, dict | list):
+            make_paths_relative(
+                value, base_directory, allow_paths_outside_base=allow_paths_outside_base
+            )
 
 
 def relative_url(value: str, base: str, allow_paths_outside_base=False) -> str:
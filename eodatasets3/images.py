@@ -1,10 +1,12 @@
+import itertools
 import math
 import os
 import string
 import sys
 import tempfile
 from collections import defaultdict
-from collections.abc import Generator, Iterable, Sequence
+from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum, auto
 from pathlib import Path, PurePath
 from typing import (
@@ -17,7 +19,6 @@ import rasterio
 import rasterio.features
 import shapely
 import shapely.affinity
-import shapely.ops
 import xarray
 from affine import Affine
 from rasterio import DatasetReader
@@ -27,7 +28,7 @@ from rasterio.enums import Resampling
 from rasterio.io import DatasetWriter, MemoryFile
 from rasterio.shutil import copy as rio_copy
 from rasterio.warp import calculate_default_transform, reproject
-from scipy.ndimage import binary_fill_holes
+from scipy.ndimage import label
 from shapely.geometry import box
 from shapely.geometry.base import CAP_STYLE, JOIN_STYLE, BaseGeometry
 
@@ -36,6 +37,33 @@ from eodatasets3.properties import FileFormat
 
 DEFAULT_OVERVIEWS = (8, 16, 32)
 
+# The GDAL creation option used to set the level of each compression method.
+COMPRESSION_LEVEL_OPTIONS = {
+    "deflate": "zlevel",
+    "zstd": "zstd_level",
+}
+
+# How many image rows to compare at a time when building valid-data masks.
+_MASK_BLOCK_ROWS = 1024
+
+# Roughly how many pixels of an image to sample when calculating its percentile stretch.
+_PERCENTILE_SAMPLE_PIXELS = 1_000_000
+
+# Quicklook bands up to this many bytes in total are read once and kept, rather
+# than read again for the reprojection.
+_QUICKLOOK_CACHED_BYTES = 512 * 1024 * 1024
+
+# Numpy changed the 'interpolation' method, but we need to still support the
+# older Python 3.6 module at NCI.
+_PERCENTILE_NEAREST = (
+    dict(interpolation="nearest")
+    if numpy.__version__ < "1.22"
+    else dict(method="nearest")
+)
+
+# How much the 'coarse' valid data method shrinks the mask before vectorizing it.
+_COARSE_MASK_FACTOR = 4
+
 try:
     import h5py
 except ImportError:
@@ -61,20 +89,27 @@ class ValidDataMethod(Enum):
     #: *slightly* slower if no holes exist.)
     filled = auto()
 
-    #: Take convex-hull of valid pixel mask before vectorizing.
+    #: Take the convex-hull of the valid pixels, without vectorizing them.
     #:
-    #: This is much slower than ``filled``, but will work in cases where
+    #: This is fast, and will work in cases where
     #: you have a lot of internal geometry that aren't holes.
     #: Such as SLC-Off Landsat 7 data.
-    #:
-    #: Requires 'scikit-image' dependency.
     convex_hull = auto()
 
+    #: Vectorize a reduced-resolution copy of the valid pixel mask, where
+    #: each block of pixels is valid if any of its pixels are.
+    #:
+    #: Much faster than ``thorough`` on large or noisy images, but the
+    #: footprint may be a few pixels larger than the valid data.
+    coarse = auto()
+
     #: Use the image file bounds, ignoring actual pixel values.
     bounds = auto()
 
 
-@attr.s(auto_attribs=True, slots=True, hash=True, frozen=True)
+# Grids are the keys for grouping every measurement (and its valid data), so they
+# cache their hash rather than rehashing the affine on each lookup.
+@attr.s(auto_attribs=True, slots=True, hash=True, frozen=True, cache_hash=True)
 class GridSpec:
     """
     The grid spec defines the coordinates/transform and size of pixels of a
@@ -161,7 +196,7 @@ class GridSpec:
 
 def generate_tiles(
     samples: int, lines: int, xtile: int = None, ytile: int = None
-) -> Generator[tuple[tuple[int, int], tuple[int, int]], None, None]:
+) -> Iterator[tuple[tuple[int, int], tuple[int, int]]]:
     """
     Generates a list of tile indices for a 2D array.
 
@@ -180,7 +215,7 @@ def generate_tiles(
         Default is min(100, lines) lines.
 
     :return:
-        Each tuple in the generator contains
+        Each tuple in the iterator contains
         ((ystart,yend),(xstart,xend)).
 
     >>> import pprint
@@ -196,38 +231,37 @@ def generate_tiles(
      ((1200, 1567), (1000, 1624))]
     """
 
-    def create_tiles(samples, lines, xstart, ystart):
-        """
-        Creates a generator object for the tiles.
-        """
-        for ystep in ystart:
-            if ystep + ytile < lines:
-                yend = ystep + ytile
-            else:
-                yend = lines
-            for xstep in xstart:
-                if xstep + xtile < samples:
-                    xend = xstep + xtile
-                else:
-                    xend = samples
-                yield ((ystep, yend), (xstep, xend))
-
     # check for default or out of bounds
     if xtile is None or xtile < 0:
         xtile = samples
     if ytile is None or ytile < 0:
         ytile = min(100, lines)
 
-    xstart = range(0, samples, xtile)
-    ystart = range(0, lines, ytile)
+    # The (start, end) of each row and column of tiles are the same for every tile,
+    # so compute them once up front.
+    y_ranges = [(y, min(y + ytile, lines)) for y in range(0, lines, ytile)]
+    x_ranges = [(x, min(x + xtile, samples)) for x in range(0, samples, xtile)]
 
-    tiles = create_tiles(samples, lines, xstart, ystart)
+    return itertools.product(y_ranges, x_ranges)
 
-    return tiles
 
+def _common_suffix(names: Sequence[str]) -> str:
+    """
+    The longest suffix shared by all names.
+
+    (compared from the end of each name in place, without building reversed copies)
 
-def _common_suffix(names: Iterable[str]) -> str:
-    return os.path.commonprefix([s[::-1] for s in names])[::-1]
+    >>> _common_suffix(['nbar_band08', 'nbart_band08'])
+    '_band08'
+    >>> _common_suffix(['blue', 'red'])
+    ''
+    """
+    length = 0
+    for chars in zip(*map(reversed, names)):
+        if chars.count(chars[0]) != len(chars):
+            break
+        length += 1
+    return names[0][len(names[0]) - length :] if names else ""
 
 
 def _find_a_common_name(
@@ -300,7 +334,9 @@ class MeasurementBundler:
         # (value is band_name->Path)
         self._measurements_per_grid: dict[GridSpec, _Measurements] = defaultdict(dict)
         # Valid data mask per grid, in pixel coordinates.
-        self.mask_by_grid: dict[GridSpec, numpy.ndarray] = {}
+        # (packed into bits along each row: see _unpack_mask(). This replaced the
+        # boolean masks of the old `mask_by_grid`)
+        self.packed_mask_by_grid: dict[GridSpec, numpy.ndarray] = {}
 
     def record_image(
         self,
@@ -326,24 +362,46 @@ class MeasurementBundler:
     def _expand_valid_data_mask(
         self, grid: GridSpec, img: numpy.ndarray, nodata: float | int
     ):
-        if nodata is None:
-            nodata = float("nan") if numpy.issubdtype(img.dtype, numpy.floating) else 0
+        # Images are combined a block at a time, so we never need an image-sized temporary.
+        for rows in _image_blocks(img):
+            self.expand_valid_data_rows(grid, rows, img[rows], nodata)
 
-        if math.isnan(nodata):
-            valid_values = numpy.isfinite(img)
-        else:
-            valid_values = img != nodata
+    def expand_valid_data_rows(
+        self,
+        grid: GridSpec,
+        rows: slice,
+        img_rows: numpy.ndarray,
+        nodata: float | int | None,
+    ):
+        """
+        Add the valid pixels of a strip of an image's rows to its grid's valid data.
 
-        mask = self.mask_by_grid.get(grid)
+        (For images that are read a strip at a time anyway, such as when writing them
+        from hdf5: see :meth:`FileWrite.write_from_ndarray`)
+        """
+        if nodata is None:
+            nodata = (
+                float("nan") if numpy.issubdtype(img_rows.dtype, numpy.floating) else 0
+            )
+
+        # Masks are kept packed eight pixels to a byte, so that holding one per grid
+        # is cheap, and combining another image is an OR over an eighth of the memory.
+        mask = self.packed_mask_by_grid.get(grid)
         if mask is None:
-            mask = valid_values
-        else:
-            mask |= valid_values
-        self.mask_by_grid[grid] = mask
+            mask = numpy.zeros(
+                (grid.shape[0], (grid.shape[1] + 7) // 8), dtype=numpy.uint8
+            )
+            self.packed_mask_by_grid[grid] = mask
+        mask[rows] |= numpy.packbits(_valid_values(img_rows, nodata), axis=-1)
 
     def _as_named_grids(self) -> dict[str, tuple[GridSpec, _Measurements]]:
         """Get our grids with sensible (hopefully!), names."""
 
+        # Only one grid (the common case)? It's the default. Nothing to do!
+        if len(self._measurements_per_grid) == 1:
+            [only_grid] = self._measurements_per_grid.items()
+            return {"default": only_grid}
+
         # Order grids from most to fewest measurements.
         # PyCharm's typing seems to get confused by the sorted() call.
         # noinspection PyTypeChecker
@@ -356,10 +414,6 @@ class MeasurementBundler:
 
         named_grids = {"default": default_grid}
 
-        # No other grids? Nothing to do!
-        if not grids_by_frequency:
-            return named_grids
-
         # First try to name them via common prefixes, suffixes etc.
         all_measurement_names = set(self.iter_names())
         for grid, measurements in grids_by_frequency:
@@ -464,30 +518,26 @@ class MeasurementBundler:
 
         geoms = []
 
-        while self.mask_by_grid:
-            grid, mask = self.mask_by_grid.popitem()
+        while self.packed_mask_by_grid:
+            grid, packed_mask = self.packed_mask_by_grid.popitem()
+            mask = _unpack_mask(packed_mask, grid.shape[1])
 
             if valid_data_method is ValidDataMethod.bounds:
                 geom = box(*grid.bounds)
             elif valid_data_method is ValidDataMethod.filled:
-                mask = mask.astype("uint8")
-                binary_fill_holes(mask, output=mask)
-                geom = _grid_to_poly(grid, mask)
+                geom = _grid_to_poly(grid, _fill_holes(mask))
             elif valid_data_method is ValidDataMethod.convex_hull:
-                # Requires optional dependency scikit-image
-                from skimage import morphology as morph
-
-                geom = _grid_to_poly(
-                    grid, morph.convex_hull_image(mask).astype("uint8")
-                )
+                geom = _hull_to_poly(grid, _mask_convex_hull(mask), mask.shape)
+            elif valid_data_method is ValidDataMethod.coarse:
+                geom = _grid_to_poly(grid, mask, downscale=_COARSE_MASK_FACTOR)
             elif valid_data_method is ValidDataMethod.thorough:
-                geom = _grid_to_poly(grid, mask.astype("uint8"))
+                geom = _grid_to_poly(grid, mask)
             else:
                 raise NotImplementedError(
                     f"Unexpected valid data method: {valid_data_method}"
                 )
             geoms.append(geom)
-        return shapely.ops.unary_union(geoms)
+        return shapely.unary_union(geoms)
 
     def iter_names(self) -> Generator[str, None, None]:
         """All known measurement names"""
@@ -502,42 +552,187 @@ class MeasurementBundler:
                 yield grid, band_name, meas_path.path
 
 
-def _valid_shape(shape: BaseGeometry) -> BaseGeometry:
-    if shape.is_valid:
-        return shape
-    return shape.buffer(0)
+def _valid_values(img: numpy.ndarray, nodata: float | int) -> numpy.ndarray:
+    """Which pixels of the image have a value?"""
+    if math.isnan(nodata):
+        return numpy.isfinite(img)
+    return numpy.not_equal(img, nodata)
 
 
-def _grid_to_poly(grid: GridSpec, mask: numpy.ndarray) -> BaseGeometry:
-    shape = shapely.ops.unary_union(
-        [
-            _valid_shape(shapely.geometry.shape(shape))
-            for shape, val in rasterio.features.shapes(mask)
-            if val == 1
-        ]
+def _unpack_mask(packed: numpy.ndarray, width: int) -> numpy.ndarray:
+    """
+    Expand a row-packed mask (as stored in MeasurementBundler) back to a boolean array.
+
+    >>> _unpack_mask(numpy.packbits([[True, False, True]], axis=-1), 3)
+    array([[ True, False,  True]])
+    """
+    return numpy.unpackbits(packed, axis=-1, count=width).view(bool)
+
+
+def _image_blocks(img: numpy.ndarray) -> Iterable[slice]:
+    """
+    Strips of rows to process an image in pieces.
+
+    A hdf5 dataset is read in strips one chunk tall, so the full image is never in memory.
+    """
+    step = _MASK_BLOCK_ROWS
+    if h5py is not None and isinstance(img, h5py.Dataset):
+        step = img.chunks[0] if img.chunks else img.shape[0]
+    return [numpy.s_[y : y + step] for y in range(0, img.shape[0], step)]
+
+
+def _fill_holes(mask: numpy.ndarray) -> numpy.ndarray:
+    """
+    Fill any invalid areas of the mask that aren't connected to its edge.
+
+    The same result as scipy's binary_fill_holes(), but much faster on large masks:
+    we label the invalid areas in one pass, rather than repeatedly dilating
+    inwards from the edge.
+
+    >>> _fill_holes(numpy.array([[0, 0, 0, 0, 0],
+    ...                          [0, 1, 1, 1, 0],
+    ...                          [0, 1, 0, 1, 0],
+    ...                          [0, 1, 1, 0, 0]], dtype=bool)).astype(int)
+    array([[0, 0, 0, 0, 0],
+           [0, 1, 1, 1, 0],
+           [0, 1, 1, 1, 0],
+           [0, 1, 1, 0, 0]])
+    """
+    invalid_areas, area_count = label(~mask)
+    edge_areas = numpy.concatenate(
+        (
+            invalid_areas[0],
+            invalid_areas[-1],
+            invalid_areas[:, 0],
+            invalid_areas[:, -1],
+        )
+    )
+    # Label 0 is the valid data itself: everything except the edge areas is kept.
+    is_filled = numpy.ones(area_count + 1, dtype=bool)
+    is_filled[edge_areas] = False
+    is_filled[0] = True
+    return is_filled[invalid_areas]
+
+
+def _mask_polygons(mask: numpy.ndarray) -> numpy.ndarray:
+    """
+    Polygonise the valid (True) areas of a boolean mask into an array of shapely polygons.
+
+    They're constructed in bulk, as a noisy mask can have many thousands of them.
+    """
+    ring_coords = []
+    ring_polygon_index = []
+    polygon_count = 0
+    mask = mask.astype(bool, copy=False)
+    # Masking means only the valid areas are traced: no polygons for the invalid ones.
+    # (The uint8 view of the values avoids a copy, and is 1 everywhere unmasked.)
+    for shape, _ in rasterio.features.shapes(mask.view(numpy.uint8), mask=mask):
+        # The first ring is the exterior, and any others are holes.
+        for ring in shape["coordinates"]:
+            ring_coords.append(numpy.asarray(ring, dtype="float64"))
+            ring_polygon_index.append(polygon_count)
+        polygon_count += 1
+
+    if not polygon_count:
+        return numpy.empty(0, dtype=object)
+
+    rings = shapely.linearrings(
+        numpy.concatenate(ring_coords),
+        indices=numpy.repeat(
+            numpy.arange(len(ring_coords)), [len(c) for c in ring_coords]
+        ),
     )
+    polygons = shapely.polygons(rings, indices=ring_polygon_index)
+
+    invalid = ~shapely.is_valid(polygons)
+    polygons[invalid] = shapely.buffer(polygons[invalid], 0)
+    return polygons
+
+
+def _reduce_mask(mask: numpy.ndarray, factor: int) -> numpy.ndarray:
+    """
+    Shrink a mask by an integer factor: each output pixel is valid if any of its inputs are.
+
+    >>> _reduce_mask(numpy.array([[0, 0, 0, 0, 0],
+    ...                           [0, 0, 0, 0, 1],
+    ...                           [1, 0, 0, 0, 0]], dtype=bool), 2).astype(int)
+    array([[0, 0, 1],
+           [1, 0, 0]])
+    """
+    rows = numpy.logical_or.reduceat(
+        mask, numpy.arange(0, mask.shape[0], factor), axis=0
+    )
+    return numpy.logical_or.reduceat(
+        rows, numpy.arange(0, mask.shape[1], factor), axis=1
+    )
+
+
+def _grid_to_poly(
+    grid: GridSpec, mask: numpy.ndarray, downscale: int = 1
+) -> BaseGeometry:
+    """
+    :param downscale: Vectorize a mask reduced by this factor (see :func:`_reduce_mask`)
+    """
     shape_y, shape_x = mask.shape
+    if downscale > 1:
+        mask = _reduce_mask(mask, downscale)
+    shape = shapely.unary_union(_mask_polygons(mask))
     del mask
     # convex hull
     geom = shape.convex_hull
+    if downscale > 1:
+        # back into full-resolution pixel space
+        geom = shapely.affinity.scale(geom, downscale, downscale, origin=(0, 0))
+    return _hull_to_poly(grid, geom, (shape_y, shape_x))
+
+
+def _mask_convex_hull(mask: numpy.ndarray) -> BaseGeometry:
+    """
+    The convex hull of the valid pixels in a mask, in pixel space.
+
+    Only the outermost valid pixel of each side of each row can be on the hull,
+    so we take the hull of their corners.
+
+    >>> _mask_convex_hull(numpy.array([[0, 0, 0, 0],
+    ...                                [0, 1, 0, 0],
+    ...                                [0, 0, 0, 1]], dtype=bool)).wkt
+    'POLYGON ((1 1, 1 2, 3 3, 4 3, 4 2, 2 1, 1 1))'
+    """
+    rows = numpy.flatnonzero(mask.any(axis=1))
+    if not rows.size:
+        return shapely.Polygon()
+    row_masks = mask[rows]
+    # The first and last valid column in each valid row.
+    lefts = row_masks.argmax(axis=1)
+    rights = mask.shape[1] - row_masks[:, ::-1].argmax(axis=1)
+    corners = numpy.concatenate(
+        [
+            numpy.column_stack((xs, ys))
+            for xs in (lefts, rights)
+            for ys in (rows, rows + 1)
+        ]
+    )
+    return shapely.MultiPoint(corners).convex_hull
+
+
+def _hull_to_poly(
+    grid: GridSpec, geom: BaseGeometry, shape_yx: tuple[int, int]
+) -> BaseGeometry:
+    """
+    Turn a pixel-space hull into a (slightly padded) valid data polygon in CRS space.
+    """
+    shape_y, shape_x = shape_yx
     # buffer by 1 pixel
     geom = geom.buffer(1, cap_style=CAP_STYLE.square, join_style=JOIN_STYLE.bevel)
     # simplify with 1 pixel radius
     geom = geom.simplify(1)
     # intersect with image bounding box
     geom = geom.intersection(shapely.geometry.box(0, 0, shape_x, shape_y))
-    # transform from pixel space into CRS space
-    geom = shapely.affinity.affine_transform(
-        geom,
-        (
-            grid.transform.a,
-            grid.transform.b,
-            grid.transform.d,
-            grid.transform.e,
-            grid.transform.xoff,
-            grid.transform.yoff,
-        ),
-    )
+    # transform from pixel space into CRS space, as one matrix product over all coordinates
+    t = grid.transform
+    matrix = numpy.array([[t.a, t.d], [t.b, t.e]])
+    offset = numpy.array([t.xoff, t.yoff])
+    geom = shapely.transform(geom, lambda coords: coords @ matrix + offset)
     return geom
 
 
@@ -589,6 +784,7 @@ class FileWrite:
         overview_blocksize: int | None = None,
         compress="deflate",
         zlevel=4,
+        num_threads: int | str | None = "all_cpus",
     ) -> "FileWrite":
         """Returns write_img options according to the source imagery provided
         :param overviews:
@@ -597,9 +793,21 @@ class FileWrite:
             (int) override the derived base blockxsize in cogtif conversion
         :param blockysize:
             (int) override the derived base blockysize in cogtif conversion
+        :param compress:
+            GDAL compression method, eg. 'deflate' or 'zstd'
+        :param zlevel:
+            compression level, for methods that have one
+        :param num_threads:
+            number of threads GDAL may use to compress blocks and build
+            overviews ('all_cpus', or an int). None to compress on one thread.
 
         """
-        options = {"compress": compress, "zlevel": zlevel}
+        options = {"compress": compress}
+        level_option = COMPRESSION_LEVEL_OPTIONS.get(compress.lower())
+        if level_option and zlevel is not None:
+            options[level_option] = zlevel
+        if num_threads is not None:
+            options["num_threads"] = num_threads
 
         y_size, x_size = blocksize_yx or (512, 512)
         # Do not set block sizes for small imagery
@@ -623,6 +831,7 @@ class FileWrite:
         nodata: int = None,
         overview_resampling=Resampling.nearest,
         overviews: tuple[int, ...] | None = DEFAULT_OVERVIEWS,
+        rows_written: Callable[[slice, numpy.ndarray], None] | None = None,
     ) -> WriteResult:
         """
         Writes a 2D/3D image to disk using rasterio.
@@ -644,6 +853,11 @@ class FileWrite:
             from `rasterio.enums.Resampling`
             Default is `Resampling.nearest`.
 
+        :param rows_written:
+            (Optional, 2D only) Called with each strip of rows of the image and
+            their pixels, as they're written. Hdf5 datasets are only read once,
+            so they can be inspected this way without being read again.
+
         :notes:
             If array is an instance of a `h5py.Dataset`, then the output
             file will include blocksizes based on the `h5py.Dataset's`
@@ -668,7 +882,8 @@ class FileWrite:
 
         # convert any bools to uin8
         if dtype == "bool":
-            array = numpy.uint8(array)
+            # Numpy bools are already one byte of 0 or 1, so we can reinterpret them without a copy.
+            array = numpy.asarray(array).view(numpy.uint8)
             dtype = "uint8"
 
         ndims = array.ndim
@@ -685,6 +900,8 @@ class FileWrite:
             bands = shape[0]
         else:
             raise IndexError(f"Input array is not of 2 or 3 dimensions. Got {ndims}")
+        if rows_written and bands != 1:
+            raise NotImplementedError("rows_written is only supported for 2D images")
 
         transform = None
         projection = None
@@ -707,8 +924,9 @@ class FileWrite:
 
         if h5py is not None and isinstance(array, h5py.Dataset):
             # TODO: if array is 3D get x & y chunks
-            if array.chunks[1] == array.shape[1]:
-                # GDAL doesn't like tiled or blocksize options to be set
+            if array.chunks is None or array.chunks[1] == array.shape[1]:
+                # Contiguous datasets have no tiles to write by.
+                # And GDAL doesn't like tiled or blocksize options to be set
                 # the same length as the columns (probably true for rows as well)
                 array = array[:]
             else:
@@ -737,14 +955,25 @@ class FileWrite:
             with rasterio.open(unstructured_image, "w", **rio_args) as outds:
                 if bands == 1:
                     if h5py is not None and isinstance(array, h5py.Dataset):
-                        for tile in tiles:
-                            idx = (
-                                slice(tile[0][0], tile[0][1]),
-                                slice(tile[1][0], tile[1][1]),
-                            )
-                            outds.write(array[idx], 1, window=tile)
+                        # Read a row of chunks at a time, so each is decompressed once.
+                        for rows in _image_blocks(array):
+                            strip = array[rows]
+                            if rows_written:
+                                rows_written(rows, strip)
+                            for x in range(0, samples, x_tile):
+                                outds.write(
+                                    strip[:, x : x + x_tile],
+                                    1,
+                                    window=(
+                                        (rows.start, rows.start + len(strip)),
+                                        (x, min(x + x_tile, samples)),
+                                    ),
+                                )
                     else:
                         outds.write(array, 1)
+                        if rows_written:
+                            for rows in _image_blocks(array):
+                                rows_written(rows, array[rows])
                 else:
                     if h5py is not None and isinstance(array, h5py.Dataset):
                         for tile in tiles:
@@ -763,7 +992,10 @@ class FileWrite:
 
                 # overviews/pyramids to disk
                 if overviews:
-                    outds.build_overviews(overviews, overview_resampling)
+                    with rasterio.Env(
+                        GDAL_NUM_THREADS=self.options.get("num_threads", 1)
+                    ):
+                        outds.build_overviews(overviews, overview_resampling)
 
             if overviews:
                 # Move the overviews to the start of the file, as required to be COG-compliant.
@@ -1042,16 +1274,26 @@ class FileWrite:
             out_data[data != bit] = 0
             stretch = (0, bit)
         if lookup_table is not None:
-            out_data = [
-                numpy.full_like(data, 0),
-                numpy.full_like(data, 0),
-                numpy.full_like(data, 0),
-            ]
             stretch = (0, 255)
-
-            for value, rgb in lookup_table.items():
-                for index in range(3):
-                    out_data[index][data == value] = rgb[index]
+            if data.dtype.kind == "u" and data.dtype.itemsize <= 2:
+                # Small unsigned types (the usual for categorical data) can be coloured
+                # in one pass, by indexing a table of every value's colour.
+                colours = numpy.zeros(
+                    (3, int(data.max(initial=0)) + 1), dtype=data.dtype
+                )
+                for value, rgb in lookup_table.items():
+                    if 0 <= value < colours.shape[1]:
+                        colours[:, value] = rgb
+                out_data = list(colours[:, data])
+            else:
+                out_data = [
+                    numpy.full_like(data, 0),
+                    numpy.full_like(data, 0),
+                    numpy.full_like(data, 0),
+                ]
+                for value, rgb in lookup_table.items():
+                    for index in range(3):
+                        out_data[index][data == value] = rgb[index]
         return out_data, stretch
 
 
@@ -1108,11 +1350,7 @@ def _write_to_numpy_array(
         valid_data_mask, _iter_arrays(rgb, nodata=nodata), percentile_range
     )
 
-    output_list = []
-
-    for band_no, (image, nodata) in enumerate(
-        _iter_arrays(rgb, nodata=nodata), start=1
-    ):
+    def reproject_band(image: numpy.ndarray) -> numpy.ndarray:
         reprojected_data = numpy.zeros(reproj_grid.shape, dtype=numpy.uint8)
         reproject(
             rescale_intensity(
@@ -1130,10 +1368,16 @@ def _write_to_numpy_array(
             dst_nodata=0,
             dst_transform=reproj_grid.transform,
             resampling=resampling,
-            num_threads=2,
+            num_threads=1,
+        )
+        return reprojected_data
+
+    # The bands are already in memory, and GDAL releases the GIL while warping,
+    # so we reproject them all at once.
+    with ThreadPoolExecutor(max_workers=len(rgb)) as pool:
+        output_list = list(
+            pool.map(reproject_band, (image for image, _ in _iter_arrays(rgb, nodata)))
         )
-        output_list.append(reprojected_data)
-        del reprojected_data
 
     return reproj_grid, output_list, ql_write_args
 
@@ -1189,14 +1433,22 @@ def _write_quicklook(
     with rasterio.open(dest_path, "w", **ql_write_args) as ql_ds:
         ql_ds: DatasetWriter
 
+        # If the bands are small enough to hold, read them only once for both passes.
+        cached_images = None
+        if _image_bytes(rgb) <= _QUICKLOOK_CACHED_BYTES:
+            cached_images = list(_iter_images(rgb))
+
         # Calculate combined nodata mask
         valid_data_mask = numpy.ones(input_geobox.shape, dtype="bool")
         calculated_range = read_valid_mask_and_value_range(
-            valid_data_mask, _iter_images(rgb), percentile_range
+            valid_data_mask, cached_images or _iter_images(rgb), percentile_range
         )
 
-        for band_no, (image, nodata) in enumerate(_iter_images(rgb), start=1):
-            reprojected_data = numpy.zeros(reproj_grid.shape, dtype=numpy.uint8)
+        for band_no, (image, nodata) in enumerate(
+            cached_images or _iter_images(rgb), start=1
+        ):
+            # Warp straight into the output band: GDAL works through it in chunks,
+            # so we never hold a whole reprojected band in memory.
             reproject(
                 rescale_intensity(
                     image,
@@ -1205,7 +1457,7 @@ def _write_quicklook(
                     out_range=(1, 255),
                     out_dtype=numpy.uint8,
                 ),
-                reprojected_data,
+                rasterio.band(ql_ds, band_no),
                 src_crs=input_geobox.crs,
                 src_transform=input_geobox.transform,
                 src_nodata=0,
@@ -1215,8 +1467,6 @@ def _write_quicklook(
                 resampling=resampling,
                 num_threads=2,
             )
-            ql_ds.write(reprojected_data, band_no)
-            del reprojected_data
 
     return reproj_grid
 
@@ -1231,13 +1481,28 @@ def _iter_images(rgb: Sequence[Path]) -> LazyImages:
     Yields the image array and nodata value.
     """
     for path in rgb:
-        with rasterio.open(path) as ds:
+        # Let GDAL decompress the blocks of tiled images (such as COGs) in parallel.
+        with rasterio.Env(GDAL_NUM_THREADS="ALL_CPUS"), rasterio.open(path) as ds:
             ds: DatasetReader
             if ds.count != 1:
                 raise NotImplementedError(
                     "multi-band measurement files aren't yet supported"
                 )
-            yield ds.read(1), ds.nodata
+            image, nodata = ds.read(1), ds.nodata
+        yield image, nodata
+
+
+def _image_bytes(paths: Sequence[Path]) -> int:
+    """How much memory would the given images take once read? (from their headers)"""
+    total = 0
+    for path in paths:
+        with rasterio.open(path) as ds:
+            ds: DatasetReader
+            total += sum(
+                ds.width * ds.height * numpy.dtype(dtype).itemsize
+                for dtype in ds.dtypes
+            )
+    return total
 
 
 def _iter_arrays(rgb: Sequence[numpy.array], nodata: int) -> LazyImages:
@@ -1257,25 +1522,34 @@ def read_valid_mask_and_value_range(
 ) -> tuple[int, int] | None:
     """
     Read the given images, filling in a valid data mask and optional pixel percentiles.
+
+    (Percentiles of large images are calculated from an evenly-strided sample of their pixels)
     """
     calculated_range = (-sys.maxsize - 1, sys.maxsize)
+    # Each band's nodata comparison is done a strip of rows at a time, into the same small
+    # buffer, so it's combined into the mask while still in cache.
+    band_valid = numpy.empty((0, *valid_data_mask.shape[1:]), dtype=bool)
     for array, nodata in images:
-        valid_data_mask &= array != nodata
+        blocks = _image_blocks(array)
+        # (hdf5 strips are a chunk tall, which may be more than we've needed before)
+        strip_height = max(len(valid_data_mask[rows]) for rows in blocks)
+        if strip_height > len(band_valid):
+            band_valid = numpy.empty(
+                (strip_height, *valid_data_mask.shape[1:]), dtype=bool
+            )
+        for rows in blocks:
+            strip_valid = band_valid[: len(valid_data_mask[rows])]
+            numpy.not_equal(array[rows], nodata, out=strip_valid)
+            valid_data_mask[rows] &= strip_valid
 
         if calculate_percentiles is not None:
-            the_data = array[valid_data_mask]
+            # Percentiles of a strided sample of large images are indistinguishable
+            # once stretched to 8-bit, and far cheaper than sorting every pixel.
+            step = max(1, math.isqrt(array.size // _PERCENTILE_SAMPLE_PIXELS))
+            the_data = array[::step, ::step][valid_data_mask[::step, ::step]]
             # Check if there's a non-empty array first
             if the_data.any():
-                # Numpy changed the 'interpolation' method, but we need to still support the
-                # older Python 3.6 module at NCI.
-                if numpy.__version__ < "1.22":
-                    low, high = numpy.percentile(
-                        the_data, calculate_percentiles, interpolation="nearest"
-                    )
-                else:
-                    low, high = numpy.percentile(
-                        the_data, calculate_percentiles, method="nearest"
-                    )
+                low, high = _nearest_percentiles(the_data, calculate_percentiles)
                 calculated_range = (
                     max(low, calculated_range[0]),
                     min(high, calculated_range[1]),
@@ -1284,6 +1558,34 @@ def read_valid_mask_and_value_range(
     return calculated_range
 
 
+def _nearest_percentiles(
+    data: numpy.ndarray, percentiles: tuple[int, int]
+) -> tuple[int, int]:
+    """
+    The given percentiles of the (1D) data, using numpy's "nearest" method.
+
+    >>> [int(v) for v in _nearest_percentiles(numpy.array([7, 3, 9, 4]), (0, 100))]
+    [3, 9]
+    >>> [int(v) for v in _nearest_percentiles(numpy.array([7, 3, 9, 4], numpy.uint8), (25, 75))]
+    [4, 7]
+    """
+    if set(percentiles) <= {0, 100}:
+        # The extremes are a single reduction: no counting or sorting needed.
+        return tuple(data.min() if p == 0 else data.max() for p in percentiles)
+
+    if data.dtype.kind == "u" and data.dtype.itemsize <= 2:
+        # Small unsigned types can be counted rather than sorted: the value at each
+        # percentile's rank is the first whose cumulative count reaches past it.
+        ranks = numpy.around((data.size - 1) * (numpy.asarray(percentiles) / 100))
+        cumulative_counts = numpy.cumsum(numpy.bincount(data))
+        return tuple(
+            data.dtype.type(value)
+            for value in numpy.searchsorted(cumulative_counts, ranks, side="right")
+        )
+
+    return numpy.percentile(data, percentiles, **_PERCENTILE_NEAREST)
+
+
 def rescale_intensity(
     image: numpy.ndarray,
     in_range: tuple[int, int],
@@ -1298,23 +1600,36 @@ def rescale_intensity(
 
     (and it saves us bringing in the entire dependency for one small method)
     """
-    if image_null_mask is None:
-        if image_nodata is None:
-            raise ValueError("Must specify either a null mask or a nodata val")
-        image_null_mask = image == image_nodata
+    if image_null_mask is None and image_nodata is None:
+        raise ValueError("Must specify either a null mask or a nodata val")
 
     imin, imax = in_range
     omin, omax = out_range or (numpy.iinfo(out_dtype).min, numpy.iinfo(out_dtype).max)
 
-    # The intermediate calculation will need floats.
-    # We'll convert to it immediately to avoid modifying the input array
-    image = image.astype(numpy.float64)
-
-    numpy.clip(image, imin, imax, out=image)
-    image -= imin
-    image /= float(imax - imin)
-    image *= omax - omin
-    image += omin
-    image = image.astype(out_dtype)
-    image[image_null_mask] = out_nodata
+    def rescale(values: numpy.ndarray) -> numpy.ndarray:
+        # (modifies the given float array)
+        numpy.clip(values, imin, imax, out=values)
+        values -= imin
+        values /= float(imax - imin)
+        values *= omax - omin
+        values += omin
+        return values.astype(out_dtype)
+
+    if image.dtype in (numpy.uint8, numpy.uint16):
+        # Small integer types have few enough possible values that we can rescale each
+        # of them once, and look up every pixel's result in a single pass.
+        lookup = rescale(numpy.arange(numpy.iinfo(image.dtype).max + 1, dtype=float))
+        if image_null_mask is None:
+            if 0 <= image_nodata < len(lookup) and image_nodata == int(image_nodata):
+                lookup[int(image_nodata)] = out_nodata
+            return lookup[image]
+        image = lookup[image]
+    else:
+        if image_null_mask is None:
+            image_null_mask = image == image_nodata
+        # The intermediate calculation will need floats.
+        # We'll convert to it immediately to avoid modifying the input array
+        image = rescale(image.astype(numpy.float64))
+
+    numpy.putmask(image, image_null_mask, out_nodata)
     return image
@@ -13,7 +13,7 @@ import click
 import rasterio
 from click import secho
 
-from eodatasets3 import wagl
+from eodatasets3 import images, wagl
 from eodatasets3.ui import PathPath
 
 DEFAULT_MATURITY = wagl.ProductMaturity.stable
@@ -82,6 +82,12 @@ DEFAULT_MATURITY = wagl.ProductMaturity.stable
     type=float,
     default=None,
 )
+@click.option(
+    "--compress",
+    help="Compression method for output measurements (default: deflate)",
+    type=click.Choice(list(images.COMPRESSION_LEVEL_OPTIONS), case_sensitive=False),
+    default="deflate",
+)
 @click.argument("h5_file", type=PathPath(exists=True, readable=True, writable=False))
 def run(
     level1: Path,
@@ -93,6 +99,7 @@ def run(
     allow_missing_provenance: bool,
     oa_resolution: float | None,
     contiguity_resolution: float | None,
+    compress: str,
 ):
     if products:
         products = {p.lower() for p in products}
@@ -126,6 +133,7 @@ def run(
                     include_oa=with_oa,
                     oa_resolution=oa_resolution,
                     contiguity_resolution=contiguity_resolution,
+                    compress=compress.lower(),
                 )
                 secho(f"Created folder {click.style(str(dataset_path), fg='green')}")
 
@@ -16,9 +16,11 @@ import sys
 import tarfile
 import tempfile
 import traceback
+from collections import deque
 from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import suppress
-from functools import partial
+from functools import lru_cache, partial
 from itertools import chain
 from pathlib import Path
 from typing import IO
@@ -34,7 +36,9 @@ from structlog.processors import (
     format_exc_info,
 )
 
+from eodatasets3.images import COMPRESSION_LEVEL_OPTIONS
 from eodatasets3.ui import PathPath
+from eodatasets3.utils import usable_cpu_count
 from eodatasets3.verify import PackageChecksum
 
 _PREDICTOR_TABLE = {
@@ -50,6 +54,12 @@ _PREDICTOR_TABLE = {
     "float64": 3,
 }
 
+# The levels accepted by each compression method.
+_LEVEL_RANGES = {
+    "deflate": (0, 9),
+    "zstd": (1, 22),
+}
+
 # The info of a file, and a method to open the file for reading.
 ReadableMember = tuple[tarfile.TarInfo, Callable[[], IO]]
 
@@ -60,6 +70,35 @@ class RecompressFailure(Exception):
     pass
 
 
+@lru_cache
+def _user_name(uid: int) -> str | None:
+    """
+    The name of the given user id, if known.
+
+    Cached, as every file in a package usually has the same owner, and the
+    lookup may go over the network (LDAP etc).
+    """
+    if tarfile.pwd:
+        try:
+            return tarfile.pwd.getpwuid(uid)[0]
+        except KeyError:
+            pass
+    return None
+
+
+@lru_cache
+def _group_name(gid: int) -> str | None:
+    """
+    The name of the given group id, if known. (cached, as with _user_name)
+    """
+    if tarfile.grp:
+        try:
+            return tarfile.grp.getgrgid(gid)[0]
+        except KeyError:
+            pass
+    return None
+
+
 def _create_tarinfo(path: Path, name=None) -> tarfile.TarInfo:
     """
     Create a TarInfo ("tar member") based on the given filesystem path.
@@ -89,16 +128,8 @@ def _create_tarinfo(path: Path, name=None) -> tarfile.TarInfo:
     info.gid = s.st_gid
     info.mtime = s.st_mtime
 
-    if tarfile.pwd:
-        try:
-            info.uname = tarfile.pwd.getpwuid(info.uid)[0]
-        except KeyError:
-            pass
-    if tarfile.grp:
-        try:
-            info.gname = tarfile.grp.getgrgid(info.gid)[0]
-        except KeyError:
-            pass
+    info.uname = _user_name(info.uid) or info.uname
+    info.gname = _group_name(info.gid) or info.gname
     return info
 
 
@@ -137,6 +168,7 @@ def repackage_tar(
     input_files: Iterable[ReadableMember],
     output_tar_path: Path,
     clean_inputs: bool,
+    workers: int = 1,
     **compress_args,
 ) -> bool:
     log = _LOG.bind(
@@ -156,7 +188,9 @@ def repackage_tar(
         # This slows down this repackage a little, as we're seeking/decompressing the input stream an extra time.
         _reorder_tar_members(members, input_path.name)
 
-        _create_tar_with_files(input_path, members, output_tar_path, **compress_args)
+        _create_tar_with_files(
+            input_path, members, output_tar_path, workers=workers, **compress_args
+        )
 
         log.info(
             "complete",
@@ -185,12 +219,16 @@ def _create_tar_with_files(
     input_path: Path,
     members: list[ReadableMember],
     output_tar_path: Path,
+    workers: int = 1,
     **compress_args,
 ) -> None:
     """
     Package and compress the given input files to a new tar path.
 
     The output tar path is written atomically, so on failure it will only exist if complete.
+
+    Up to `workers` members are recompressed concurrently, but they're always read and
+    written in their original order.
     """
 
     out_dir: Path = output_tar_path.parent
@@ -203,12 +241,28 @@ def _create_tar_with_files(
         tmpdir = Path(tmpdir).absolute()
         tmp_out_tar = tmpdir.joinpath(output_tar_path.name)
 
-        with tarfile.open(tmp_out_tar, "w") as out_tar:
+        with (
+            tarfile.open(tmp_out_tar, "w") as out_tar,
+            ThreadPoolExecutor(max_workers=workers) as pool,
+        ):
             with click.progressbar(
                 label=input_path.name,
                 length=sum(member.size for member, _ in members),
                 file=sys.stderr,
             ) as progress:
+                pending: deque[tuple[tarfile.TarInfo, Future]] = deque()
+
+                def _finish_oldest():
+                    member, recompressing = pending.popleft()
+                    new_member, contents = recompressing.result()
+                    if contents is None:
+                        # Typically a directory entry.
+                        out_tar.addfile(new_member)
+                    else:
+                        out_tar.addfile(new_member, io.BytesIO(contents))
+                        verify.add(io.BytesIO(contents), tmpdir / new_member.name)
+                    progress.update(member.size)
+
                 file_number = 0
                 for readable_member in members:
                     file_number += 1
@@ -216,12 +270,23 @@ def _create_tar_with_files(
                         f"{input_path.name} ({file_number:2d}/{len(members)})"
                     )
 
-                    _recompress_tar_member(
-                        readable_member, out_tar, compress_args, verify, tmpdir
+                    # Input tars can only be read sequentially, so we read here
+                    # and only hand the (GIL-releasing) recompression to the pool.
+                    member, contents = _read_tar_member(readable_member)
+                    pending.append(
+                        (
+                            member,
+                            pool.submit(
+                                _recompress_tar_member, member, contents, compress_args
+                            ),
+                        )
                     )
+                    # Bound the number of members held in memory at once.
+                    if len(pending) > workers:
+                        _finish_oldest()
 
-                    member, _ = readable_member
-                    progress.update(member.size)
+                while pending:
+                    _finish_oldest()
 
             # Append sha1 checksum file
             checksum_path = tmpdir / "package.sha1"
@@ -236,23 +301,38 @@ def _create_tar_with_files(
             tmp_out_tar.rename(output_tar_path)
 
 
-def _recompress_tar_member(
+def _read_tar_member(
     readable_member: ReadableMember,
-    out_tar: tarfile.TarFile,
-    compress_args: dict,
-    verify: PackageChecksum,
-    tmpdir: Path,
-):
+) -> tuple[tarfile.TarInfo, bytes | None]:
+    """Read the contents of a member, or None if it has none (typically a directory)."""
     member, open_member = readable_member
+    if member.size == 0:
+        return member, None
+
+    with open_member() as f:
+        return member, f.read()
 
+
+def _recompress_tar_member(
+    member: tarfile.TarInfo,
+    contents: bytes | None,
+    compress_args: dict,
+) -> tuple[tarfile.TarInfo, bytes | None]:
+    """
+    Get the output member and contents for an input member, compressing it if
+    it's an uncompressed tif.
+    """
     new_member = copy.copy(member)
     # Copy with a minimum 664 permission, which is used by USGS tars.
     # (some of our repacked datasets have only user read permission.)
     new_member.mode = new_member.mode | 0o664
 
+    if contents is None:
+        return new_member, None
+
     # If it's a tif, check whether it's compressed.
     if member.name.lower().endswith(".tif"):
-        with open_member() as input_fp, rasterio.open(input_fp) as ds:
+        with rasterio.MemoryFile(contents) as input_file, input_file.open() as ds:
             if not ds.profile.get("compress"):
                 # No compression: let's compress it
                 with rasterio.MemoryFile(filename=member.name) as memory_file:
@@ -260,28 +340,14 @@ def _recompress_tar_member(
                         _recompress_image(ds, memory_file, **compress_args)
                     except Exception as e:
                         raise RecompressFailure(f"Error during {member.name}") from e
-                    new_member.size = memory_file.getbuffer().nbytes
-                    out_tar.addfile(new_member, memory_file)
-
-                    # Image has been written. Seek to beginning to take a checksum.
-                    memory_file.seek(0)
-                    verify.add(memory_file, tmpdir / new_member.name)
-                    return
+                    contents = bytes(memory_file.getbuffer())
+                    new_member.size = len(contents)
             else:
-                # It's already compressed, we'll fall through and copy it verbatim.
+                # It's already compressed, we'll copy it verbatim.
                 pass
 
-    if member.size == 0:
-        # Typically a directory entry.
-        out_tar.addfile(new_member)
-        return
-
-    # Copy unchanged into target (typically text/metadata files).
-    with open_member() as member:
-        file_contents = member.read()
-    out_tar.addfile(new_member, io.BytesIO(file_contents))
-    verify.add(io.BytesIO(file_contents), tmpdir / new_member.name)
-    del file_contents
+    # Otherwise copied unchanged into target (typically text/metadata files).
+    return new_member, contents
 
 
 def _reorder_tar_members(members: list[ReadableMember], identifier: str):
@@ -307,6 +373,7 @@ def _reorder_tar_members(members: list[ReadableMember], identifier: str):
 def _recompress_image(
     input_image: rasterio.DatasetReader,
     output_fp: rasterio.MemoryFile,
+    compress="deflate",
     zlevel=9,
     block_size=(512, 512),
 ):
@@ -328,8 +395,8 @@ def _recompress_image(
     profile.update(
         driver="GTiff",
         predictor=_PREDICTOR_TABLE[array.dtype.name],
-        compress="deflate",
-        zlevel=zlevel,
+        compress=compress,
+        **{COMPRESSION_LEVEL_OPTIONS[compress]: zlevel},
         blockxsize=block_size_x,
         blockysize=block_size_y,
         tiled=True,
@@ -349,7 +416,18 @@ def _recompress_image(
     help="The base output directory (default to same dir as input if --clean-inputs).",
 )
 @click.option(
-    "--zlevel", type=click.IntRange(0, 9), default=5, help="Deflate compression level."
+    "--compress",
+    type=click.Choice(list(COMPRESSION_LEVEL_OPTIONS), case_sensitive=False),
+    default="deflate",
+    show_default=True,
+    help="Image compression method. (zstd is faster, but readers need GDAL with zstd)",
+)
+@click.option(
+    "--zlevel",
+    type=click.IntRange(0, 22),
+    default=5,
+    show_default=True,
+    help="Compression level: 0-9 for deflate, 1-22 for zstd (higher is smaller but slower).",
 )
 @click.option(
     "--block-size", type=int, default=512, help="Compression block size (both x and y)"
@@ -359,15 +437,26 @@ def _recompress_image(
     default=False,
     help="Delete originals after repackaging",
 )
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=usable_cpu_count,
+    envvar="EODATASETS_RECOMPRESS_WORKERS",
+    show_default="CPUs available to this process",
+    help="How many images to compress at once. "
+    "(each one in progress is held in memory)",
+)
 @click.option("-f", "input_file", help="Read paths from file", type=click.File("r"))
 @click.argument("paths", nargs=-1, type=PathPath(exists=True, readable=True))
 def main(
     paths: list[Path],
     input_file,
     output_base: Path,
+    compress: str,
     zlevel: int,
     clean_inputs: bool,
     block_size: int,
+    workers: int,
 ):
     # Structured (json) logging goes to stdout
     structlog.configure(
@@ -385,6 +474,13 @@ def main(
             "or to clean inputs (--clean-inputs)"
         )
 
+    min_level, max_level = _LEVEL_RANGES[compress.lower()]
+    if not min_level <= zlevel <= max_level:
+        raise click.BadParameter(
+            f"{compress} levels are from {min_level} to {max_level}",
+            param_hint="--zlevel",
+        )
+
     if input_file:
         paths = chain((Path(p.strip()) for p in input_file), paths)
 
@@ -401,6 +497,8 @@ def main(
                         _tar_members(in_tar),
                         _output_tar_path(output_base, path),
                         clean_inputs=clean_inputs,
+                        workers=workers,
+                        compress=compress.lower(),
                         zlevel=zlevel,
                         block_size=(block_size, block_size),
                     )
@@ -411,6 +509,8 @@ def main(
                     _folder_members(path),
                     _output_tar_path_from_directory(output_base, path),
                     clean_inputs=clean_inputs,
+                    workers=workers,
+                    compress=compress.lower(),
                     zlevel=zlevel,
                     block_size=(block_size, block_size),
                 )
@@ -435,12 +535,17 @@ def please_remove(path: Path, excluding: Path):
     """
     Delete all of path, excluding the given path.
     """
-    if path.absolute() == excluding.absolute():
+    # Make both absolute just once: iterdir() of an absolute path gives absolute children.
+    _remove_excluding(path.absolute(), excluding.absolute())
+
+
+def _remove_excluding(path: Path, excluding: Path):
+    if path == excluding:
         return
 
     if path.is_dir():
         for p in path.iterdir():
-            please_remove(p, excluding)
+            _remove_excluding(p, excluding)
         with suppress(OSError):
             path.rmdir()
     else:
@@ -1,16 +1,15 @@
 import uuid
 from collections.abc import Iterable, Mapping
 from datetime import datetime
-from functools import partial
+from functools import cache, partial
 from pathlib import Path, PurePath
-from typing import IO
+from typing import IO, TYPE_CHECKING
 from uuid import UUID
 
 import attr
 import cattr
 import ciso8601
 import click
-import jsonschema
 import numpy
 import shapely
 import shapely.affinity
@@ -26,6 +25,9 @@ from shapely.geometry.base import BaseGeometry
 from eodatasets3.model import ODC_DATASET_SCHEMA_URL, DatasetDoc, Eo3Dict
 from eodatasets3.properties import FileFormat
 
+if TYPE_CHECKING:
+    import jsonschema
+
 converter = cattr.Converter()
 
 
@@ -163,12 +165,13 @@ def _is_json_array(checker, instance) -> bool:
     return isinstance(instance, list | tuple)
 
 
-def _load_schema_validator(p: Path) -> jsonschema.Draft7Validator:
+def _load_schema_validator(p: Path) -> "jsonschema.Draft7Validator":
     """
     Create a schema instance for the file.
 
     (Assumes they are trustworthy. Only local schemas!)
     """
+    import jsonschema
     import referencing
 
     if not p.is_file():
@@ -201,13 +204,25 @@ def _load_schema_validator(p: Path) -> jsonschema.Draft7Validator:
     return validator(schema, registry=registry)
 
 
-DATASET_SCHEMA = _load_schema_validator(Path(__file__).parent / "dataset.schema.yaml")
-PRODUCT_SCHEMA = _load_schema_validator(
-    DATACUBE_SCHEMAS_PATH / "dataset-type-schema.yaml"
-)
-METADATA_TYPE_SCHEMA = _load_schema_validator(
-    DATACUBE_SCHEMAS_PATH / "metadata-type-schema.yaml"
-)
+# The schema validators are loaded on first use (via the module __getattr__ below):
+# importing jsonschema and checking the schemas is a large part of our import time,
+# and most commands never validate a document.
+_SCHEMA_PATHS = {
+    "DATASET_SCHEMA": Path(__file__).parent / "dataset.schema.yaml",
+    "PRODUCT_SCHEMA": DATACUBE_SCHEMAS_PATH / "dataset-type-schema.yaml",
+    "METADATA_TYPE_SCHEMA": DATACUBE_SCHEMAS_PATH / "metadata-type-schema.yaml",
+}
+
+
+@cache
+def _schema_validator(name: str) -> "jsonschema.Draft7Validator":
+    return _load_schema_validator(_SCHEMA_PATHS[name])
+
+
+def __getattr__(name: str):
+    if name in _SCHEMA_PATHS:
+        return _schema_validator(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def from_doc(doc: dict, skip_validation=False) -> DatasetDoc:
@@ -228,7 +243,7 @@ def from_doc(doc: dict, skip_validation=False) -> DatasetDoc:
             del doc["extent"]
         if doc.get("grid_spatial"):
             del doc["grid_spatial"]
-        DATASET_SCHEMA.validate(doc)
+        _schema_validator("DATASET_SCHEMA").validate(doc)
 
     # TODO: stable cattrs (<1.0) balks at the $schema variable.
     del doc["$schema"]
@@ -63,6 +63,18 @@ def read_paths_from_file(listing: Path) -> Iterable[Path]:
             yield path.absolute()
 
 
+def usable_cpu_count() -> int:
+    """
+    How many CPUs this process may run on.
+
+    (Unlike os.cpu_count(), this respects the affinity/cgroup limits of batch jobs
+    on shared nodes.)
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return 1
+
+
 def default_utc(d: datetime) -> datetime:
     if d.tzinfo is None:
         return d.replace(tzinfo=timezone.utc)
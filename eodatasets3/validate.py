@@ -31,7 +31,6 @@ from attr import Factory, define, field, frozen
 from boltons.iterutils import get_path
 from click import echo, secho, style
 from datacube import Datacube
-from datacube.index.eo3 import prep_eo3
 from datacube.utils import InvalidDocException, changes, is_url, read_documents
 from datacube.utils.documents import load_documents
 from rasterio import DatasetReader
@@ -359,6 +358,9 @@ def validate_dataset(
             )
 
     if metadata_type_definition:
+        # Imported here, as it brings in odc-stac/pystac, which are slow to import.
+        from datacube.index.eo3 import prep_eo3
+
         # Datacube does certain transforms on an eo3 doc before storage.
         # We need to do the same, as the fields will be read from the storage.
         prepared_doc = prep_eo3(doc)
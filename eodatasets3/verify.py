@@ -3,14 +3,23 @@ import hashlib
 import logging
 import os
 import typing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from shutil import which
 from urllib.parse import urlparse
 
 import boto3
 
+from eodatasets3.utils import usable_cpu_count
+
 _LOG = logging.getLogger(__name__)
 
+# Read files in large blocks: hashlib releases the GIL while digesting them, so
+# several files can be checksummed concurrently on threads.
+_HASH_BLOCK_SIZE = 1024 * 1024
+_CHECKSUM_WORKERS = min(8, usable_cpu_count())
+
 
 def is_s3_uri(uri):
     parsed_uri = urlparse(uri)
@@ -51,7 +60,7 @@ def calculate_file_sha1(filename):
     return calculate_file_hash(filename, hash_fn=hashlib.sha1)
 
 
-def calculate_file_hash(filename, hash_fn=hashlib.sha1, block_size=4096):
+def calculate_file_hash(filename, hash_fn=hashlib.sha1, block_size=_HASH_BLOCK_SIZE):
     """
     Calculate the hash of the contents of a given file path.
     :type filename: str or Path
@@ -77,7 +86,7 @@ def calculate_file_hash(filename, hash_fn=hashlib.sha1, block_size=4096):
             return calculate_hash(f, hash_fn, block_size)
 
 
-def calculate_hash(f, hash_fn=hashlib.sha1, block_size=4096):
+def calculate_hash(f, hash_fn=hashlib.sha1, block_size=_HASH_BLOCK_SIZE):
     m = hash_fn()
 
     while True:
@@ -176,8 +185,19 @@ class PackageChecksum:
         self._file_hashes[Path(file_path).absolute()] = hash_
 
     def add_files(self, file_paths):
+        """
+        Add many files to the checksum list, hashing local files concurrently.
+        """
+        local_files = []
         for path in file_paths:
-            self.add_file(path)
+            if is_s3_uri(str(path)) or path.is_dir():
+                self.add_file(path)
+            else:
+                local_files.append(path)
+
+        with ThreadPoolExecutor(max_workers=_CHECKSUM_WORKERS) as pool:
+            for path, hash_ in zip(local_files, pool.map(self._checksum, local_files)):
+                self._append_hash(path, hash_)
 
     def write(self, output_file: Path | str):
         """
@@ -218,9 +238,17 @@ class PackageChecksum:
 
         :rtype: [(Path, bool)]
         """
-        for path, hash_ in self.items():
-            calculated_hash = self._checksum(path)
-            yield path, calculated_hash == hash_
+        # Files are hashed concurrently, but only a few ahead of what's been consumed.
+        pending: deque[tuple[Path, str, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=_CHECKSUM_WORKERS) as pool:
+            for path, hash_ in list(self.items()):
+                pending.append((path, hash_, pool.submit(self._checksum, path)))
+                if len(pending) > _CHECKSUM_WORKERS:
+                    done_path, expected_hash, calculated = pending.popleft()
+                    yield done_path, calculated.result() == expected_hash
+            while pending:
+                done_path, expected_hash, calculated = pending.popleft()
+                yield done_path, calculated.result() == expected_hash
 
     def __bool__(self):
         return bool(self._file_hashes)
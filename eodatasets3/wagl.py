@@ -14,6 +14,7 @@ import zipfile
 from collections.abc import Iterable, Sequence
 from datetime import datetime, timedelta
 from enum import Enum
+from functools import lru_cache
 from math import isnan
 from os.path import join
 from pathlib import Path
@@ -59,6 +60,17 @@ _THUMBNAILS = {
 
 os.environ["CPL_ZIP_ENCODING"] = "UTF-8"
 
+# HDF5 chunk cache settings for reading the wagl imagery.
+#
+# HDF5's default cache is only 1MB, which is smaller than a single chunk of most of
+# wagl's images, so chunks were decompressed again on every partial read.
+# (The cache, and its slot table, is allocated per open dataset, so keep both modest.)
+H5_CHUNK_CACHE = dict(
+    rdcc_nbytes=32 * 1024 * 1024,
+    # (should be prime, and ~100x the number of chunks that fit in the cache)
+    rdcc_nslots=25_013,
+)
+
 FILENAME_TIF_BAND = re.compile(
     r"(?P<prefix>(?:.*_)?)(?P<band_name>B[0-9][A0-9]|B[0-9]*|B[0-9a-zA-z]*)"
     r"(?P<extension>\....)"
@@ -99,11 +111,23 @@ def _find_h5_paths(h5_obj: h5py.Group, dataset_class: str = "") -> list[str]:
 
     (class examples: IMAGE, TABLE. SCALAR)
     """
-    items = []
+    return _find_h5_paths_by_class(h5_obj, dataset_class)[dataset_class]
+
+
+def _find_h5_paths_by_class(
+    h5_obj: h5py.Group, *dataset_classes: str
+) -> dict[str, list[str]]:
+    """
+    Find the paths of all objects of each of the given classes.
+
+    This is a single walk of the h5 tree, no matter how many classes are requested.
+    """
+    items = {dataset_class: [] for dataset_class in dataset_classes}
 
     def _find(name, obj):
-        if obj.attrs.get("CLASS") == dataset_class:
-            items.append(name)
+        paths = items.get(obj.attrs.get("CLASS"))
+        if paths is not None:
+            paths.append(name)
 
     h5_obj.visititems(_find)
     return items
@@ -114,16 +138,22 @@ def _unpack_products(
     product_list: Iterable[str],
     h5group: h5py.Group,
     granule: "Granule",
+    img_paths: Sequence[str] | None = None,
 ) -> None:
     """
     Unpack and package the NBAR and NBART products.
+
+    :param img_paths: paths of all datasets of IMAGE CLASS type, if already known.
     """
-    # listing of all datasets of IMAGE CLASS type
-    img_paths = _find_h5_paths(h5group, "IMAGE")
+    if img_paths is None:
+        img_paths = _find_h5_paths(h5group, "IMAGE")
+
+    product_list = list(product_list)
+    product_paths = _paths_by_group(img_paths, [s.upper() for s in product_list])
 
     for product in product_list:
         with sub_product(product, p):
-            for pathname in [p for p in img_paths if f"/{product.upper()}/" in p]:
+            for pathname in product_paths[product.upper()]:
                 with do(f"Path {pathname!r}"):
                     dataset = h5group[pathname]
                     band_masks = get_quality_masks(dataset, granule)
@@ -154,6 +184,25 @@ def _unpack_products(
                     )
 
 
+def _paths_by_group(
+    h5_paths: Iterable[str], group_names: Iterable[str]
+) -> dict[str, list[str]]:
+    """
+    Find which of the given hdf5 paths are within each named (intermediate) group.
+
+    Done in one pass over the paths, rather than searching every path for each group.
+
+    >>> _paths_by_group(['RG-1/NBAR/BLUE', 'RG-1/NBART/BLUE', 'NBAR'], ['NBAR', 'SBT'])
+    {'NBAR': ['RG-1/NBAR/BLUE'], 'SBT': []}
+    """
+    found = {name: [] for name in group_names}
+    for path in h5_paths:
+        for group in set(path.split("/")[1:-1]):
+            if group in found:
+                found[group].append(path)
+    return found
+
+
 def get_quality_masks(
     dataset: h5py.Dataset, granule: "Granule", strict=True
 ) -> BandMasks:
@@ -342,7 +391,9 @@ def write_measurement_h5(
     if band_masks:
         data = load_and_mask_data(g, band_masks)
     else:
-        data = g[:] if hasattr(g, "chunks") else g
+        # Chunked datasets are passed as-is, so they're read a row of chunks at a
+        # time as they're written, rather than all at once.
+        data = g[:] if g.chunks is None else g
 
     product_name, band_name = full_name.split(":")
     p.write_measurement_numpy(
@@ -350,7 +401,7 @@ def write_measurement_h5(
         grid_spec=images.GridSpec(
             shape=g.shape,
             transform=Affine.from_gdal(*g.attrs["geotransform"]),
-            crs=CRS.from_wkt(g.attrs["crs_wkt"]),
+            crs=_crs_from_wkt(g.attrs["crs_wkt"]),
         ),
         nodata=g.attrs.get("no_data_value"),
         overviews=overviews,
@@ -366,6 +417,16 @@ def write_measurement_h5(
     )
 
 
+@lru_cache
+def _crs_from_wkt(wkt: str) -> CRS:
+    """
+    Parse a CRS, once for all of the (many) bands in a granule that share it.
+
+    Parsing WKT goes through PROJ, and isn't cheap.
+    """
+    return CRS.from_wkt(wkt)
+
+
 def _file_id(dataset: h5py.Dataset) -> str:
     """
     Devise a file id for the given dataset (using its attributes)
@@ -856,6 +917,7 @@ def package(
     include_oa: bool = True,
     oa_resolution: tuple[float, float] | None = None,
     contiguity_resolution: tuple[float, float] | None = None,
+    compress: str = "deflate",
 ) -> tuple[UUID, Path]:
     """
     Package an L2 product.
@@ -873,15 +935,21 @@ def package(
         A list of imagery products to include in the package.
         Defaults to all products.
 
+    :param compress:
+        GDAL compression method for the output measurements ('deflate' or 'zstd').
+
     :return:
         The dataset UUID and output metadata path
     """
     included_products = tuple(s.lower() for s in included_products)
 
-    with h5py.File(granule.wagl_hdf5, "r") as fid:
+    with h5py.File(granule.wagl_hdf5, "r", **H5_CHUNK_CACHE) as fid:
         granule_group = fid[granule.name]
 
-        wagl_doc = _read_wagl_metadata(granule_group)
+        # Find both kinds of dataset in one walk of the (large) granule tree.
+        h5_paths = _find_h5_paths_by_class(granule_group, "IMAGE", "SCALAR")
+
+        wagl_doc = _read_wagl_metadata(granule_group, h5_paths["SCALAR"])
 
         with DatasetAssembler(
             out_directory.absolute(),
@@ -892,6 +960,7 @@ def package(
                 if ("sentinel" in wagl_doc["source_datasets"]["platform_id"].lower())
                 else "dea"
             ),
+            compress=compress,
         ) as p:
             _apply_wagl_metadata(p, wagl_doc)
 
@@ -943,7 +1012,9 @@ def package(
             if granule.tesp_doc:
                 _take_software_versions(p, granule.tesp_doc)
 
-            _unpack_products(p, included_products, granule_group, granule)
+            _unpack_products(
+                p, included_products, granule_group, granule, h5_paths["IMAGE"]
+            )
 
             if include_oa:
                 with sub_product("oa", p):
@@ -1099,11 +1170,13 @@ def find_a_granule_name(wagl_hdf5: Path) -> str:
     return wagl_hdf5.name[: -len(".wagl.h5")]
 
 
-def _read_wagl_metadata(granule_group: h5py.Group):
+def _read_wagl_metadata(
+    granule_group: h5py.Group, scalar_paths: Sequence[str] | None = None
+):
+    if scalar_paths is None:
+        scalar_paths = _find_h5_paths(granule_group, "SCALAR")
     try:
-        wagl_path, *ancil_paths = (
-            pth for pth in _find_h5_paths(granule_group, "SCALAR") if "METADATA" in pth
-        )
+        wagl_path, *ancil_paths = (pth for pth in scalar_paths if "METADATA" in pth)
     except ValueError:
         raise ValueError("No nbar metadata found in granule")
 
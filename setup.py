@@ -30,8 +30,9 @@ EXTRAS_REQUIRE = {
     "wagl": ["h5py"],
     # The (legacy) prepare scripts
     "ancillary": ["checksumdir", "netCDF4"],
-    # Optional valid-data poly handling methods
-    "algorithms": ["scikit-image"],
+    # Valid-data poly methods no longer need anything extra (they used scikit-image).
+    # Kept so that existing installs of this extra still resolve.
+    "algorithms": [],
 }
 EXTRAS_REQUIRE["all"] = list(chain(EXTRAS_REQUIRE.values()))
 # Tests need all those optionals too.
@@ -82,7 +83,7 @@ setup(
         "rasterio",
         "ruamel.yaml<0.18",
         "scipy",
-        "shapely",
+        "shapely>=2",
         "structlog",
         "xarray",
         "datacube>=1.9.0",
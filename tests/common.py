@@ -47,16 +47,18 @@ def assert_expected_eo3_path(
     assert expected_path.exists(), (
         f"Expected output EO3 path doesn't exist: {expected_path}"
     )
-    assert_same_as_file(
+    # Parsed once, and used for both comparisons below.
+    generated_doc = load_yaml(expected_path)
+    _assert_same_doc_ignoring(
         expected_doc,
-        expected_path,
+        dict(generated_doc),
         # We check the geometry below
         ignore_fields=("geometry", *ignore_fields),
     )
 
     if "geometry" not in ignore_fields:
         # Compare geometry after parsing, rather than comparing the raw dict values.
-        produced_dataset = serialise.from_path(expected_path)
+        produced_dataset = serialise.from_doc(generated_doc)
         expected_dataset = serialise.from_doc(expected_doc, skip_validation=True)
         if expected_dataset.geometry is None:
             assert produced_dataset.geometry is None, (
@@ -136,7 +138,14 @@ def assert_same_as_file(expected_doc: dict, generated_file: Path, ignore_fields=
 
     assert generated_file.exists(), f"Expected file to exist {generated_file.name}"
 
-    generated_doc = load_yaml(generated_file)
+    _assert_same_doc_ignoring(expected_doc, load_yaml(generated_file), ignore_fields)
+
+
+def _assert_same_doc_ignoring(
+    expected_doc: dict, generated_doc: dict, ignore_fields=()
+):
+    """(Removes the ignored fields from the given generated_doc)"""
+    __tracebackhide__ = operator.methodcaller("errisinstance", AssertionError)
 
     expected_doc = dict(expected_doc)
     for field in ignore_fields:
@@ -9,10 +9,15 @@ matter much but the structure does. The downsampling is dirty.)
 
 import re
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 
 import click
 import h5py
+import numpy
+import rasterio
+from affine import Affine
 from click import secho, style
 
 from eodatasets3.ui import PathPath
@@ -43,9 +48,6 @@ RES_GROUP_PATH = re.compile(r"(.*/RES-GROUP-\d+)/")
 @click.option("--factor", type=int, default=100)
 @click.option("--anti-alias/--no-anti-alias", is_flag=True, default=False)
 def downsample(input_path: Path, factor: int, anti_alias: bool):
-    # Fail early if h5repack cli command is not available.
-    from sh import gdal_translate, h5repack
-
     granule_name = find_a_granule_name(input_path)
     fmask_image = input_path.with_name(f"{granule_name}.fmask.img")
 
@@ -57,26 +59,41 @@ def downsample(input_path: Path, factor: int, anti_alias: bool):
     shutil.copy(input_path, original)
 
     try:
-        with h5py.File(input_path, "r+") as f:
+        with h5py.File(input_path, "r") as f:
             image_paths = find_h5_paths(f, "IMAGE")
-            secho(f"Found {len(image_paths)} images")
-            for i, image_path in enumerate(image_paths):
-                old_image: h5py.Dataset | None = f[image_path]
+        secho(f"Found {len(image_paths)} images")
+
+        # Reading (and decompressing) the images is the slow part, so each is done in its own
+        # process. Hdf5 only allows one writer, so the results are written back here in turn.
+        with ProcessPoolExecutor() as pool:
+            downsampled = list(
+                pool.map(
+                    _read_downsampled,
+                    repeat(input_path),
+                    image_paths,
+                    repeat(factor),
+                    repeat(anti_alias),
+                )
+            )
+
+        with h5py.File(input_path, "r+") as f:
+            for i, (image_path, (pixel_scale, new_data)) in enumerate(
+                zip(image_paths, downsampled)
+            ):
 
                 def info(msg: str):
                     secho(
                         f"{i: 4}/{len(image_paths)} {style(repr(image_path), fg='blue')}: {msg}"
                     )
 
-                old_shape = old_image.shape
-                if all(dim_size < factor for dim_size in old_shape):
+                if new_data is None:
                     info("Skipping")
                     continue
 
+                old_image: h5py.Dataset | None = f[image_path]
                 attrs = dict(old_image.attrs.items())
                 old_geotransform = attrs["geotransform"]
 
-                new_data = old_image[()][::factor, ::factor]
                 new_shape = new_data.shape
                 info(f"New shape: {new_shape!r}")
                 del old_image
@@ -85,10 +102,16 @@ def downsample(input_path: Path, factor: int, anti_alias: bool):
                 folder, name = image_path.rsplit("/", 1)
                 parent: h5py.Group = f[str(folder)]
 
-                image = parent.create_dataset(name, new_shape, data=new_data)
+                image = parent.create_dataset(
+                    name,
+                    new_shape,
+                    data=new_data,
+                    compression="gzip",
+                    compression_opts=5,
+                )
                 new_geotransform = list(old_geotransform)
-                new_geotransform[1] *= old_shape[1] / new_shape[1]
-                new_geotransform[5] *= old_shape[0] / new_shape[0]
+                new_geotransform[1] *= pixel_scale[1]
+                new_geotransform[5] *= pixel_scale[0]
                 attrs["geotransform"] = new_geotransform
                 image.attrs.update(attrs)
 
@@ -109,7 +132,7 @@ def downsample(input_path: Path, factor: int, anti_alias: bool):
 
         # We need to repack the file to actually free up the space.
         repacked = input_path.with_suffix(".repacked.h5")
-        h5repack("-f", "GZIP=5", input_path, repacked)
+        _repack(input_path, repacked)
         repacked.rename(input_path)
     except Exception:
         secho("Restoring backup")
@@ -123,10 +146,97 @@ def downsample(input_path: Path, factor: int, anti_alias: bool):
         secho(f"Scaling fmask {fmask_image}")
 
         tmp = fmask_image.with_suffix(f".tmp.{fmask_image.suffix}")
-        gdal_translate("-outsize", nbar_size[1], nbar_size[0], fmask_image, tmp)
+        _resize_image(fmask_image, tmp, nbar_size)
         tmp.rename(fmask_image)
 
 
+def _resize_image(input_path: Path, output_path: Path, shape: tuple[int, int]):
+    """
+    Write a copy of the image at a new pixel size.
+
+    (Equivalent to `gdal_translate -outsize`, but without a subprocess per image.)
+    """
+    height, width = shape
+    with rasterio.open(input_path) as ds:
+        profile = ds.profile
+        profile.update(
+            width=width,
+            height=height,
+            transform=ds.transform * Affine.scale(ds.width / width, ds.height / height),
+        )
+        data = ds.read(out_shape=(ds.count, height, width))
+
+        with rasterio.open(output_path, "w", **profile) as out:
+            out.write(data)
+            out.update_tags(**ds.tags())
+
+
+def _read_downsampled(
+    input_path: Path, image_path: str, factor: int, anti_alias: bool
+) -> tuple[tuple[float, float], numpy.ndarray | None]:
+    """
+    Read a downsampled copy of an image, and how much larger its pixels are (y, x).
+
+    (None if the image is already small enough.)
+    """
+    with h5py.File(input_path, "r") as f:
+        image: h5py.Dataset = f[image_path]
+        if all(dim_size < factor for dim_size in image.shape):
+            return (1, 1), None
+        if anti_alias and min(image.shape) >= factor:
+            # (partial edge blocks are dropped, so the pixels are exactly factor times larger)
+            return (factor, factor), _block_mean(image, factor)
+        # (a strided selection, so hdf5 only reads the pixels we keep)
+        new_data = image[::factor, ::factor]
+        return (
+            image.shape[0] / new_data.shape[0],
+            image.shape[1] / new_data.shape[1],
+        ), new_data
+
+
+def _block_mean(image: h5py.Dataset, factor: int) -> numpy.ndarray:
+    """
+    Downsample by averaging each factor x factor block of pixels (dropping any partial blocks).
+
+    Nodata pixels are left out of the average, and blocks without any valid pixels
+    are nodata.
+
+    (It reads one row of blocks at a time, so the full image is never in memory.)
+    """
+    nodata = image.attrs.get("no_data_value")
+    height = image.shape[0] // factor * factor
+    width = image.shape[1] // factor * factor
+
+    def block_row_mean(y: int) -> numpy.ndarray:
+        blocks = image[y : y + factor, :width].reshape(factor, width // factor, factor)
+        if nodata is not None:
+            blocks = (
+                numpy.ma.masked_invalid(blocks)
+                if numpy.isnan(nodata)
+                else numpy.ma.masked_equal(blocks, nodata)
+            )
+        return numpy.ma.filled(
+            blocks.mean(axis=(0, 2), dtype=numpy.float32), fill_value=nodata
+        )
+
+    return numpy.stack([block_row_mean(y) for y in range(0, height, factor)]).astype(
+        image.dtype
+    )
+
+
+def _repack(input_path: Path, output_path: Path):
+    """
+    Copy everything into a new file, leaving behind the space freed by deleted datasets.
+
+    (Equivalent to `h5repack`, but in-process: hdf5 copies the stored chunks
+    without decompressing them.)
+    """
+    with h5py.File(input_path, "r") as src, h5py.File(output_path, "w") as dest:
+        dest.attrs.update(src.attrs)
+        for name in src:
+            src.copy(src[name], dest, name=name)
+
+
 def _get_res_group_path(image_path: str) -> str | None:
     """
     >>> _get_res_group_path('LC80920842016180LGN01/RES-GROUP-1/STANDARDISED-PRODUCTS/REFLECTANCE/NBART/BAND-7')
@@ -13,6 +13,10 @@ from uuid import UUID
 
 import numpy
 import pytest
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Compression
 from ruamel import yaml
 
 from eodatasets3 import DatasetAssembler, DatasetPrepare, namer, serialise
@@ -507,3 +511,34 @@ def test_add_source_dataset(tmp_path: Path, inherit_geom):
         # Geometry is not set from the source dataset, but instead from the added wofs measurement
         assert output.geometry is not None
         assert output.geometry != source_dataset.geometry
+
+
+def test_assemble_with_zstd(tmp_path: Path):
+    """
+    Measurements can be written with an alternative compression method.
+    """
+    out = tmp_path / "out"
+    out.mkdir()
+
+    # Unknown methods are refused up front, before anything is written.
+    with pytest.raises(ValueError, match="Unsupported compression 'lzma'"):
+        DatasetAssembler(out, compress="lzma")
+
+    grid_spec = GridSpec(
+        shape=(100, 100),
+        transform=Affine(30.0, 0.0, 0.0, 0.0, -30.0, 0.0),
+        crs=CRS.from_epsg(32655),
+    )
+    with DatasetAssembler(out, compress="zstd") as p:
+        p.datetime = datetime(2019, 7, 4, 13, 7, 5)
+        p.product_name = "loch_ness_sightings"
+        p.processed = datetime(2019, 7, 4, 13, 8, 7)
+
+        p.write_measurement_numpy(
+            "blue", numpy.ones(grid_spec.shape, dtype=numpy.int16), grid_spec
+        )
+        dataset_id, metadata_path = p.done()
+
+    [blue_path] = metadata_path.parent.glob("*_blue.tif")
+    with rasterio.open(blue_path) as ds:
+        assert ds.compression == Compression.zstd
@@ -1,7 +1,30 @@
+from pathlib import Path
+
+import h5py
 import numpy as np
+import rasterio
+import shapely
+import shapely.affinity
+from affine import Affine
+from rasterio.crs import CRS
+from shapely.geometry.base import BaseGeometry
 
 from eodatasets3 import images
 
+# The pixel grid of our test images (in UTM, 30m pixels), which only vary by shape.
+_TRANSFORM = Affine(30.0, 0.0, 241485.0, 0.0, -30.0, -2281485.0)
+
+
+def _grid(shape: tuple[int, int]) -> images.GridSpec:
+    return images.GridSpec(shape=shape, transform=_TRANSFORM, crs=CRS.from_epsg(32656))
+
+
+def _valid_data(image: np.ndarray, method: images.ValidDataMethod) -> BaseGeometry:
+    """The valid data geometry of a single image with nodata 0"""
+    bundler = images.MeasurementBundler()
+    bundler.record_image("blue", _grid(image.shape), "blue.tif", image, nodata=0)
+    return bundler.consume_and_get_valid_data(method)
+
 
 def test_rescale_intensity():
     # Example was generated via:
@@ -60,10 +83,34 @@ def test_rescale_intensity():
     )
     assert np.array_equal(staticly_rescaled, expected_static_rescale)
 
+    # Unsigned images are rescaled via a lookup table, which should give identical results.
+    unsigned_image = np.where(original_image == nada, 0, original_image).astype(
+        np.uint16
+    )
+    for nodata_args in (
+        dict(image_nodata=0),
+        dict(image_null_mask=unsigned_image == 0),
+    ):
+        assert np.array_equal(
+            images.rescale_intensity(
+                unsigned_image,
+                in_range=(4000, 6000),
+                out_range=(100, 255),
+                **nodata_args,
+            ),
+            expected_static_rescale,
+        )
+    assert np.array_equal(
+        unsigned_image, np.where(unmodified == nada, 0, unmodified)
+    ), "rescale_intensity modified the input image"
+
 
-def test_calc_range():
+def test_calc_range(monkeypatch):
     # Test that the correct value range and valid data arrays are calculated.
 
+    # (Masks are combined in strips of rows: use a size that doesn't divide the image evenly)
+    monkeypatch.setattr(images, "_MASK_BLOCK_ROWS", 5)
+
     # Test arrays generated via:
     # >>> scipy.ndimage.rotate(np.arange(10, 70, 1).reshape((6, 10)), 55, cval=-11)
     # >>> scipy.ndimage.rotate(np.arange(20, 80, 1).reshape((6, 10)), 50, cval=-11)
@@ -158,3 +205,196 @@ def test_calc_range():
         34,
         65,
     ), f"Unexpected 2/98 percentile values: {calculated_range}"
+
+    # Unsigned bands have their percentiles counted rather than sorted: the same result.
+    mask = np.ones(r_array.shape, dtype=np.bool_)
+    assert (
+        images.read_valid_mask_and_value_range(
+            mask,
+            [
+                (np.where(a == no, 0, a).astype(np.uint8), 0)
+                for a in (r_array, g_array, b_array)
+            ],
+            calculate_percentiles=(2, 98),
+        )
+        == calculated_range
+    )
+    assert np.array_equal(expected_combined_mask, mask)
+
+
+def test_write_bool_array(tmp_path: Path):
+    # Bools should be written as a uint8 image of 0/1.
+    mask = np.zeros((12, 11), dtype=bool)
+    mask[2:9, 3:7] = True
+    out_path = tmp_path / "mask.tif"
+
+    images.FileWrite.from_existing(mask.shape).write_from_ndarray(
+        mask,
+        out_path,
+        geobox=_grid(mask.shape),
+        overviews=None,
+    )
+
+    with rasterio.open(out_path) as ds:
+        assert ds.dtypes == ("uint8",)
+        assert np.array_equal(ds.read(1), mask.astype(np.uint8))
+
+
+def test_valid_data_mask_from_chunked_hdf5(tmp_path: Path):
+    # A h5py dataset is read chunk by chunk, but should give the same mask as an in-memory array.
+    image = np.full((20, 30), -999, dtype=np.int16)
+    image[3:17, 5:22] = 42
+    grid = _grid(image.shape)
+
+    with h5py.File(tmp_path / "test.h5", "w") as f:
+        dataset = f.create_dataset("image", data=image, chunks=(8, 8))
+
+        from_hdf5 = images.MeasurementBundler()
+        from_hdf5.record_image("blue", grid, "blue.tif", dataset, nodata=-999)
+
+    from_array = images.MeasurementBundler()
+    from_array.record_image("blue", grid, "blue.tif", image, nodata=-999)
+
+    assert np.array_equal(
+        from_hdf5.packed_mask_by_grid[grid], from_array.packed_mask_by_grid[grid]
+    )
+    assert images._unpack_mask(
+        from_hdf5.packed_mask_by_grid[grid], image.shape[1]
+    ).sum() == (14 * 17)
+
+
+def test_calc_range_with_tall_hdf5_chunks(tmp_path: Path, monkeypatch):
+    # A h5py dataset is read a chunk at a time, even when chunks are taller than our own strips.
+    monkeypatch.setattr(images, "_MASK_BLOCK_ROWS", 5)
+    image = np.full((20, 30), -999, dtype=np.int16)
+    image[3:17, 5:22] = np.arange(14 * 17).reshape((14, 17))
+    other = image.copy()
+    other[:, 21] = -999
+
+    mask = np.ones(image.shape, dtype=np.bool_)
+    with h5py.File(tmp_path / "test.h5", "w") as f:
+        dataset = f.create_dataset("image", data=image, chunks=(12, 30))
+        value_range = images.read_valid_mask_and_value_range(
+            mask, ((other, -999), (dataset, -999)), calculate_percentiles=(0, 100)
+        )
+
+    expected_mask = np.zeros(image.shape, dtype=np.bool_)
+    expected_mask[3:17, 5:21] = True
+    assert np.array_equal(mask, expected_mask)
+    assert value_range == (image[expected_mask].min(), image[expected_mask].max())
+
+
+def test_valid_data_mask_combines_images(monkeypatch):
+    # Use tiny blocks, so that combining images spans several of them.
+    monkeypatch.setattr(images, "_MASK_BLOCK_ROWS", 3)
+
+    # (a width that doesn't fill its last byte of packed mask)
+    blue = np.full((10, 11), -999, dtype=np.int16)
+    blue[1:4, 1:4] = 42
+    green = np.full((10, 11), np.nan, dtype=np.float32)
+    green[5:9, 2:10] = 0.5
+    grid = _grid(blue.shape)
+
+    bundler = images.MeasurementBundler()
+    bundler.record_image("blue", grid, "blue.tif", blue, nodata=-999)
+    bundler.record_image("green", grid, "green.tif", green)
+
+    assert np.array_equal(
+        images._unpack_mask(bundler.packed_mask_by_grid[grid], blue.shape[1]),
+        (blue != -999) | np.isfinite(green),
+    )
+
+
+def test_coarse_valid_data_covers_thorough():
+    image = np.zeros((100, 120), dtype=np.int16)
+    image[10:83, 7:101] = 42
+    # Some scattered nodata holes.
+    image[20:80:7, 15:95:5] = 0
+    thorough = _valid_data(image, images.ValidDataMethod.thorough)
+    coarse = _valid_data(image, images.ValidDataMethod.coarse)
+
+    assert coarse.contains(thorough)
+    # No more than a few pixels larger on each side.
+    assert coarse.area < thorough.buffer(4 * 30).area
+
+
+def test_convex_hull_valid_data():
+    # A triangle of valid pixels, and one outlying pixel that should pull the hull out.
+    yy, xx = np.mgrid[:60, :80]
+    image = np.where((xx >= 10) & (xx <= yy + 10) & (yy < 50), 42, 0).astype(np.int16)
+    image[5, 70] = 42
+    convex_hull = _valid_data(image, images.ValidDataMethod.convex_hull)
+
+    # Expected: the hull of every valid pixel's square, padded by a pixel and
+    # clipped to the image, in CRS coordinates.
+    pixel_hull = shapely.union_all(
+        [shapely.box(x, y, x + 1, y + 1) for y, x in zip(*np.nonzero(image))]
+    ).convex_hull
+    expected = shapely.affinity.affine_transform(
+        pixel_hull.buffer(1, cap_style="square", join_style="bevel")
+        .simplify(1)
+        .intersection(shapely.box(0, 0, 80, 60)),
+        _TRANSFORM.to_shapely(),
+    )
+    assert convex_hull.equals_exact(expected, tolerance=1e-6)
+
+    # The thorough method also takes the hull of the vectorised pixels: they should agree.
+    assert convex_hull.equals(_valid_data(image, images.ValidDataMethod.thorough))
+
+
+def test_filled_valid_data_with_holes():
+    image = np.zeros((60, 80), dtype=np.int16)
+    image[10:50, 10:70] = 42
+    without_holes = image.copy()
+    # Holes: nodata pixels entirely enclosed by valid data.
+    image[20:25, 20:30] = 0
+    image[35, 40:60] = 0
+    image[30, 15] = 0
+    filled = _valid_data(image, images.ValidDataMethod.filled)
+    assert filled.geom_type == "Polygon"
+    assert not filled.interiors
+
+    # Expected: the valid rectangle, padded by no more than a pixel (in CRS coordinates).
+    def crs_box(minx, miny, maxx, maxy):
+        return shapely.affinity.affine_transform(
+            shapely.box(minx, miny, maxx, maxy), _TRANSFORM.to_shapely()
+        )
+
+    assert filled.contains(crs_box(10, 10, 70, 50))
+    assert crs_box(9, 9, 71, 51).contains(filled)
+
+    # Same as if there were no holes at all, and as vectorising the holes.
+    assert filled.equals(_valid_data(without_holes, images.ValidDataMethod.filled))
+    assert filled.equals(_valid_data(image, images.ValidDataMethod.thorough))
+
+
+def test_calc_range_sampled(monkeypatch):
+    # Large images have their percentiles calculated from a sample of pixels:
+    # force a small sample size so this image is sampled.
+    monkeypatch.setattr(images, "_PERCENTILE_SAMPLE_PIXELS", 1000)
+    sample_sizes = []
+    nearest_percentiles = images._nearest_percentiles
+
+    def recording_percentiles(data, percentiles):
+        sample_sizes.append(data.size)
+        return nearest_percentiles(data, percentiles)
+
+    monkeypatch.setattr(images, "_nearest_percentiles", recording_percentiles)
+
+    nodata = 0
+    rng = np.random.default_rng(42)
+    image = rng.integers(1, 10_000, size=(400, 500), dtype=np.uint16)
+    image[:, :100] = nodata
+
+    mask = np.ones(image.shape, dtype=np.bool_)
+    low, high = images.read_valid_mask_and_value_range(
+        mask, ((image, nodata),), calculate_percentiles=(2, 98)
+    )
+    assert np.array_equal(mask, image != nodata)
+    # Only a sample was used...
+    assert sample_sizes and sample_sizes[0] < 2000
+
+    # ... but its range is within 1% of the exact percentiles of every valid pixel.
+    exact_low, exact_high = np.percentile(image[mask], (2, 98), method="nearest")
+    assert abs(int(low) - int(exact_low)) < 100
+    assert abs(int(high) - int(exact_high)) < 100
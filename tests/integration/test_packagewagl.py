@@ -6,14 +6,17 @@ from pathlib import Path
 from pprint import pprint
 from textwrap import indent
 
+import numpy
 import pytest
 import rasterio
 from click.testing import CliRunner
 from rasterio import DatasetReader
+from rasterio.crs import CRS
 from rasterio.enums import Compression
 from rio_cogeo import cogeo
 
 import eodatasets3
+from eodatasets3 import DatasetAssembler, serialise
 from eodatasets3.model import DatasetDoc
 from tests import assert_file_structure
 from tests.common import assert_expected_eo3_path, assert_same_as_file, load_yaml
@@ -448,6 +451,8 @@ def test_whole_landsat_wagl_package(
         assert d.driver == "GTiff"
         assert d.dtypes == ("int16",)
         assert d.compression == Compression.deflate
+        # Horizontal differencing, which shrinks integer imagery considerably.
+        assert d.tags(ns="IMAGE_STRUCTURE")["PREDICTOR"] == "2"
 
         assert d.height == 157
         assert d.width == 156
@@ -1583,3 +1588,58 @@ def test_offshore_wagl_package(tmp_path: Path):
     doc = load_yaml(output_metadata)
     pprint(doc)
     assert doc["properties"]["dea:final_ancillaries"] == "nonstandard"
+
+
+@pytest.mark.parametrize("chunks", [None, (256, 256)], ids=["contiguous", "tiled"])
+def test_write_measurement_h5(tmp_path: Path, monkeypatch, chunks):
+    """
+    Hdf5 bands are copied exactly, whether they're stored contiguously or in chunks.
+
+    (and are read only once, for both the image and its valid data)
+    """
+    from eodatasets3.wagl import write_measurement_h5
+
+    pixels_read = []
+    read_dataset = h5py.Dataset.__getitem__
+
+    def counting_read(self, args):
+        data = read_dataset(self, args)
+        pixels_read.append(numpy.size(data))
+        return data
+
+    monkeypatch.setattr(h5py.Dataset, "__getitem__", counting_read)
+
+    image = (numpy.arange(600 * 700, dtype=numpy.int16) % 1000).reshape((600, 700))
+    image[:20] = -999
+    out = tmp_path / "out"
+    out.mkdir()
+
+    with h5py.File(tmp_path / "test.h5", "w") as f:
+        g = f.create_dataset("blue", data=image, chunks=chunks)
+        g.attrs["geotransform"] = (500_000.0, 30.0, 0.0, -3_700_000.0, 0.0, -30.0)
+        g.attrs["crs_wkt"] = CRS.from_epsg(32655).to_wkt()
+        g.attrs["no_data_value"] = -999
+
+        with DatasetAssembler(out) as p:
+            p.datetime = datetime(2019, 7, 4, 13, 7, 5)
+            p.product_name = "loch_ness_sightings"
+            p.processed = datetime(2019, 7, 4, 13, 8, 7)
+            write_measurement_h5(p, "nbar:blue", g)
+            assert sum(pixels_read) == image.size
+            dataset_id, metadata_path = p.done()
+
+    [blue_path] = metadata_path.parent.glob("*_blue.tif")
+    with rasterio.open(blue_path) as ds:
+        assert ds.nodata == -999
+        assert numpy.array_equal(ds.read(1), image)
+
+    # The valid data (read from the same strips) leaves out the nodata rows.
+    geometry = serialise.from_path(metadata_path).geometry
+    assert geometry.bounds == pytest.approx(
+        (
+            500_000.0,
+            -3_700_000.0 - 600 * 30,
+            500_000.0 + 700 * 30,
+            -3_700_000.0 - 19 * 30,
+        )
+    )
@@ -4,7 +4,9 @@ import warnings
 from pathlib import Path
 
 import pytest
+import rasterio
 from click.testing import CliRunner, Result
+from rasterio.enums import Compression
 
 from eodatasets3 import verify
 from eodatasets3.scripts import recompress
@@ -266,6 +268,53 @@ def test_recompress_dirty_dataset(tmp_path: Path):
     ]
 
 
+def test_recompress_workers_are_deterministic(tmp_path: Path):
+    """Compressing members concurrently should give an identical package."""
+    outputs = []
+    for workers in ("1", "4"):
+        output_base = tmp_path / f"out-{workers}"
+        _run_recompress(
+            packaged_path, "--output-base", str(output_base), "--workers", workers
+        )
+        [out_tar] = output_base.rglob("*.tar")
+        checksums, members = _get_checksums_members(out_tar)
+        outputs.append((checksums, [(m.name, m.size) for m in members]))
+
+    single_worker, multiple_workers = outputs
+    assert single_worker == multiple_workers
+
+
+def test_recompress_with_zstd(tmp_path: Path):
+    output_base = tmp_path / "out"
+    # zstd allows higher levels than deflate
+    res = _run_recompress(
+        packaged_path,
+        "--output-base",
+        str(output_base),
+        "--zlevel",
+        "15",
+        expected_return=2,
+    )
+    assert "deflate levels are from 0 to 9" in res.output
+
+    _run_recompress(
+        packaged_path,
+        "--output-base",
+        str(output_base),
+        "--compress",
+        "zstd",
+        "--zlevel",
+        "15",
+    )
+    [out_tar] = output_base.rglob("*.tar")
+
+    with tarfile.open(out_tar, "r") as tar:
+        band = tar.extractfile("LT05_L1GS_092091_19910506_20170126_01_T2_B1.TIF")
+        with rasterio.open(band) as ds:
+            assert ds.compression == Compression.zstd
+            assert ds.tags(ns="IMAGE_STRUCTURE")["PREDICTOR"] == "2"
+
+
 def test_run_with_corrupt_data(tmp_path: Path):
     output_path = tmp_path / "out"
     output_path.mkdir()
@@ -85,3 +85,39 @@ class VerifyTests(unittest.TestCase):
         }
         verification_results = set(c2.iteratively_verify())
         assert expected_verification == verification_results
+
+    def test_package_checksum_directory(self):
+        d = write_files(
+            {
+                "test1.txt": "test",
+                "package": {"test2.txt": "test2", "test3.txt": "test3"},
+            }
+        )
+
+        # Adding a directory checksums every file beneath it.
+        c = verify.PackageChecksum()
+        c.add_file(d)
+
+        assert dict(c.items()) == {
+            d.joinpath("test1.txt").absolute(): (
+                "a94a8fe5ccb19ba61c4c0873d391e987982fbbd3"
+            ),
+            d.joinpath("package", "test2.txt").absolute(): (
+                "109f4b3c50d7b0df729d299bc6f8e9ef9066971f"
+            ),
+            d.joinpath("package", "test3.txt").absolute(): (
+                "3ebfa301dc59196f18593c45e519287a23297589"
+            ),
+        }
+
+    def test_verify_many_files(self):
+        # More files than are hashed ahead at once.
+        d = write_files({f"test{i:02}.txt": f"test{i}" for i in range(30)})
+        c = verify.PackageChecksum()
+        c.add_file(d)
+
+        d.joinpath("test07.txt").write_text("changed")
+
+        results = list(c.iteratively_verify())
+        assert [path for path, _ in results] == [path for path, _ in c.items()]
+        assert [path.name for path, ok in results if not ok] == ["test07.txt"]